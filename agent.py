@@ -3,28 +3,36 @@ agent.py
 ----------
 Enhanced agent architecture for Home Energy Saver using Microsoft Agent Framework (MAF).
 
-Agents:
-- UsageCollectorAgent: Collects last’s usage from CSV and tomorrow’s forecasts
+Pipeline:
+- Usage collection: plain Python gathers last usage from CSV, tomorrow's weather
+  and per-appliance forecasts (no LLM round-trip needed for deterministic tools)
 - RecommendationAgent: Analyzes actual vs. forecasted usage and generates optimized suggestions
 """
 
 from __future__ import annotations
 
 import asyncio
+import hashlib
 import json
 import os
+import time
+from contextlib import aclosing
+from types import MappingProxyType
 from dataclasses import dataclass
-from datetime import datetime, timedelta
+from functools import lru_cache
+from datetime import date, datetime, timedelta
 from typing import List, Dict, Any, Optional
+from zoneinfo import ZoneInfo
 
+import httpx
+import orjson
 import pandas as pd
-import requests
+from cachetools import TLRUCache, TTLCache
 from pydantic import BaseModel, Field
-from agent_framework import ai_function
 from agent_framework.azure import AzureOpenAIChatClient
-from azure.identity import AzureCliCredential
+from azure.identity import AzureCliCredential, get_bearer_token_provider
 
-from prediction import predict_next_day_kwh
+from prediction import MODEL_PATHS, predict_batch
 
 
 # -------------------------------
@@ -32,6 +40,45 @@ from prediction import predict_next_day_kwh
 # -------------------------------
 CSV_PATH = "./data/appliance_usage.csv"
 CURRENCY = "INR"
+# Entra ID scope for Azure OpenAI bearer tokens
+COGNITIVE_SERVICES_SCOPE = "https://cognitiveservices.azure.com/.default"
+# WMO weather interpretation codes returned by Open-Meteo
+WMO_CONDITIONS = MappingProxyType({
+    0: "Clear", 1: "Mainly Clear", 2: "Partly Cloudy", 3: "Overcast",
+    45: "Fog", 48: "Fog", 51: "Drizzle", 53: "Drizzle", 55: "Drizzle",
+    61: "Rain", 63: "Rain", 65: "Rain", 71: "Snow", 73: "Snow", 75: "Snow",
+    80: "Rain Showers", 81: "Rain Showers", 82: "Rain Showers",
+    95: "Thunderstorm", 96: "Thunderstorm", 99: "Thunderstorm",
+})
+# HomeProfile fields forwarded to the recommender prompt
+RECOMMENDER_PROFILE_FIELDS = (
+    "hh_size", "appliances_present", "rate_peak", "rate_offpeak",
+    "tariff_peak_start", "tariff_peak_end",
+)
+
+# Shared async HTTP client so outbound calls reuse one connection pool
+_HTTP = httpx.AsyncClient(
+    timeout=10,
+    headers={"User-Agent": "HomeEnergySaver/1.0 (+https://example.com)"},
+)
+
+# In-process TTL caches for external lookups: tomorrow's forecast changes
+# only every few hours and geocodes are effectively static.
+_WEATHER_CACHE: TTLCache = TTLCache(maxsize=256, ttl=1800)
+_GEOCODE_CACHE: TTLCache = TTLCache(maxsize=4096, ttl=86400)
+
+
+def _until_local_midnight(_key, _value, now: float) -> float:
+    """Expiry for cached recommendations: the next local midnight."""
+    next_day = datetime.fromtimestamp(now).date() + timedelta(days=1)
+    return datetime.combine(next_day, datetime.min.time()).timestamp()
+
+
+# Recommender responses keyed by a hash of the (canonicalized) agent input;
+# a household re-requesting the same day gets an instant answer.
+_RECOMMENDATION_CACHE: TLRUCache = TLRUCache(
+    maxsize=1024, ttu=_until_local_midnight, timer=time.time
+)
 
 # -------------------------------
 # Helper Functions
@@ -41,16 +88,78 @@ def iso_date(dt: datetime) -> str:
     return dt.strftime("%Y-%m-%d")
 
 
+def local_tomorrow(timezone: str) -> date:
+    """Tomorrow's date in the household's timezone (not the server's)."""
+    return datetime.now(ZoneInfo(timezone)).date() + timedelta(days=1)
+
+
+_JSON_DECODER = json.JSONDecoder()
+
+
+def _object_end(text: str, start: int) -> int:
+    """Index just past the brace closing the object opened at ``start``, or -1."""
+    depth = 0
+    in_string = escaped = False
+    for i in range(start, len(text)):
+        ch = text[i]
+        if in_string:
+            if escaped:
+                escaped = False
+            elif ch == "\\":
+                escaped = True
+            elif ch == '"':
+                in_string = False
+        elif ch == '"':
+            in_string = True
+        elif ch == "{":
+            depth += 1
+        elif ch == "}":
+            depth -= 1
+            if depth == 0:
+                return i + 1
+    return -1
+
+
 def safe_json_extract(response_text: str) -> Dict[str, Any]:
-    """Extract valid JSON from a response text."""
+    """Extract valid JSON from a response text.
+
+    Falls back to scanning for the first ``{`` that starts a complete JSON
+    object, so prose before/after the JSON (or braces inside strings) is
+    handled in a single pass. A candidate that fails to parse is skipped as a
+    whole, so a truncated object never yields one of its nested objects.
+    """
     try:
-        return json.loads(response_text)
-    except json.JSONDecodeError:
-        start = response_text.find("{")
-        end = response_text.rfind("}")
-        if start != -1 and end != -1:
-            return json.loads(response_text[start:end + 1])
-        raise ValueError(f"Could not extract JSON from response: {response_text}")
+        return orjson.loads(response_text)
+    except orjson.JSONDecodeError:
+        pass
+    start = response_text.find("{")
+    while start != -1:
+        try:
+            obj, _ = _JSON_DECODER.raw_decode(response_text, start)
+            return obj
+        except json.JSONDecodeError:
+            end = _object_end(response_text, start)
+            if end == -1:
+                break
+            start = response_text.find("{", end)
+    raise ValueError(f"Could not extract JSON from response: {response_text}")
+
+def _canonicalize(obj: Any) -> Any:
+    """Round floats to 1 decimal and sort lists so equivalent inputs hash alike."""
+    if isinstance(obj, float):
+        return round(obj, 1)
+    if isinstance(obj, dict):
+        return {k: _canonicalize(v) for k, v in obj.items()}
+    if isinstance(obj, (list, tuple)):
+        items = [_canonicalize(v) for v in obj]
+        return sorted(items, key=lambda v: orjson.dumps(v, option=orjson.OPT_SORT_KEYS))
+    return obj
+
+
+def _recommendation_cache_key(rec_data: Dict[str, Any]) -> str:
+    """Stable digest of the recommender input used as the cache key."""
+    canonical = orjson.dumps(_canonicalize(rec_data), option=orjson.OPT_SORT_KEYS)
+    return hashlib.blake2b(canonical, digest_size=16).hexdigest()
 
 # -------------------------------
 # Data Models
@@ -71,7 +180,12 @@ class HomeProfile:
     city: Optional[str] = None
 
 
-def geocode_city(city: str, max_results: int = 5) -> List[Dict[str, Any]]:
+async def close_http_client() -> None:
+    """Close the shared HTTP client; call once on application shutdown."""
+    await _HTTP.aclose()
+
+
+async def geocode_city(city: str, max_results: int = 5) -> List[Dict[str, Any]]:
     """Return a list of geocoding matches for the given city string using Nominatim.
 
     Each item in the returned list contains at least: display_name, lat, lon.
@@ -79,13 +193,15 @@ def geocode_city(city: str, max_results: int = 5) -> List[Dict[str, Any]]:
     This is a light-weight helper so callers that only have a city name can
     resolve latitude/longitude without adding a heavy dependency.
     """
+    key = (city.strip().lower(), max_results)
+    if key in _GEOCODE_CACHE:
+        return _GEOCODE_CACHE[key]
     try:
         url = "https://nominatim.openstreetmap.org/search"
         params = {"q": city, "format": "json", "limit": max_results}
-        headers = {"User-Agent": "HomeEnergySaver/1.0 (+https://example.com)"}
-        resp = requests.get(url, params=params, headers=headers, timeout=10)
+        resp = await _HTTP.get(url, params=params)
         resp.raise_for_status()
-        data = resp.json()
+        data = orjson.loads(resp.content)
         results = []
         for item in data:
             results.append({
@@ -95,29 +211,34 @@ def geocode_city(city: str, max_results: int = 5) -> List[Dict[str, Any]]:
                 "type": item.get("type"),
                 "class": item.get("class"),
             })
+        # only successful lookups are cached; failures fall through to []
+        _GEOCODE_CACHE[key] = results
         return results
     except Exception:
         return []
     
 
-@ai_function(
-    name="get_last_usage_from_csv",
-    description="Load appliance usage data for the most recent date in the CSV"
-)
+@lru_cache(maxsize=4)
+def _load_usage(csv_path: str, mtime: float) -> pd.DataFrame:
+    """Parse the usage CSV once per file version; mtime in the key invalidates on edit."""
+    return pd.read_csv(csv_path, parse_dates=["date"])
+
+
 def get_last_usage_from_csv(csv_path: str = CSV_PATH) -> dict:
     """Returns a dict of last usage metrics for all appliances."""
     try:
-        df = pd.read_csv(csv_path, parse_dates=["date"])
+        df = _load_usage(csv_path, os.path.getmtime(csv_path))
         latest_date = df["date"].max()
 
-        # Filter rows for the latest date
-        latest_records = df[df["date"] == latest_date]
+        # Filter rows for the latest date (boolean mask yields a copy, cached frame stays intact)
+        latest_records = df[df["date"].values == latest_date.to_datetime64()]
 
         # Convert Timestamp to string and ensure all values are serializable
-        latest_records = latest_records.copy()
-        latest_records["date"] = latest_records["date"].dt.strftime("%Y-%m-%d")
-        latest_records["start_time"] = latest_records["start_time"].astype(str)
-        latest_records["end_time"] = latest_records["end_time"].astype(str)
+        latest_records = latest_records.assign(
+            date=latest_records["date"].dt.strftime("%Y-%m-%d"),
+            start_time=latest_records["start_time"].astype(str),
+            end_time=latest_records["end_time"].astype(str),
+        )
 
         return {
             "date": latest_date.strftime("%Y-%m-%d"),
@@ -125,85 +246,63 @@ def get_last_usage_from_csv(csv_path: str = CSV_PATH) -> dict:
         }
     except Exception as e:
         raise RuntimeError(f"Error reading CSV: {str(e)}")
-    
-@ai_function(
-    name="get_tomorrow_weather",
-    description="Gets tomorrow's weather (high, low, condition) using Open-Meteo API."
-)
-def get_tomorrow_weather(latitude: float, longitude: float, timezone: str) -> dict:
-    """Returns tomorrow's temperature high, low, and weather condition using Open-Meteo."""
-    tomorrow = (datetime.now() + timedelta(days=1)).date().isoformat()
+
+
+async def get_tomorrow_weather(
+    latitude: float, longitude: float, timezone: str, day: Optional[date] = None
+) -> dict:
+    """Returns tomorrow's temperature high, low, and weather condition using Open-Meteo.
+
+    `day` defaults to tomorrow in `timezone`; callers pass it to stay on the same date.
+    """
+    tomorrow = iso_date(day or local_tomorrow(timezone))
+    key = (round(latitude, 3), round(longitude, 3), timezone, tomorrow)
+    if key in _WEATHER_CACHE:
+        return _WEATHER_CACHE[key]
     url = "https://api.open-meteo.com/v1/forecast"
     params = {
         "latitude": latitude,
         "longitude": longitude,
         "timezone": timezone,
         "daily": "temperature_2m_max,temperature_2m_min,weathercode",
-        "forecast_days": 2
+        # fetch only tomorrow instead of today + tomorrow
+        "start_date": tomorrow,
+        "end_date": tomorrow,
     }
-    resp = requests.get(url, params=params, timeout=10)
+    resp = await _HTTP.get(url, params=params)
     resp.raise_for_status()
-    data = resp.json()
-    temp_max = data["daily"]["temperature_2m_max"][1]
-    temp_min = data["daily"]["temperature_2m_min"][1]
-    weather_code = data["daily"]["weathercode"][1]
-    code_map = {0: "Clear", 1: "Mainly Clear", 2: "Partly Cloudy", 3: "Overcast", 61: "Rain", 95: "Thunderstorm"}
-    condition = code_map.get(weather_code, "Unknown")
-    return {"date": tomorrow, "temp_high": temp_max, "temp_low": temp_min, "condition": condition}
-
-
-@ai_function(
-    name="forecast_next_day_kwh",
-    description="Predicts appliance-level kWh usage directly using ML model"
-)
-def forecast_next_day_kwh(
-    appliance: str,
-    date: str,
-    avg_temp: float,
-    hh_size: int,
-    is_weekend: int
-) -> dict:
-    """Returns the predicted kWh usage for a given appliance on a specific date."""
-    try:
-        return predict_next_day_kwh(
-            appliance=appliance,
-            ds_next=date,
-            avg_temp=avg_temp,
-            hh_size=hh_size,
-            is_weekend=is_weekend
-        )
-    except Exception as e:
-        raise RuntimeError(f"Prediction error: {str(e)}")
+    data = orjson.loads(resp.content)
+    temp_max = data["daily"]["temperature_2m_max"][0]
+    temp_min = data["daily"]["temperature_2m_min"][0]
+    weather_code = data["daily"]["weathercode"][0]
+    condition = WMO_CONDITIONS.get(weather_code, "Unknown")
+    result = {"date": tomorrow, "temp_high": temp_max, "temp_low": temp_min, "condition": condition}
+    _WEATHER_CACHE[key] = result
+    return result
 
 
 # -------------------------------
 # Create Agents
 # -------------------------------
-def create_usage_collector_agent():
-    instructions = """
-You are the UsageCollectorAgent.
+@lru_cache(maxsize=1)
+def _chat_client() -> AzureOpenAIChatClient:
+    """Shared chat client; credential + client construction happens once per process.
 
-1. Load last appliance usage from CSV.
-2. Get tomorrow's weather forecast.
-3. For each appliance, gather next day's kWh forecast.
-
-Return JSON ONLY:
-{
-  "last_usage": ...,  "weather": ...,  "forecasts": [...list of forecasts...]
-}
-"""
-    client = AzureOpenAIChatClient(credential=AzureCliCredential())
-    return client.create_agent(
-        instructions=instructions,
-        tools=[get_last_usage_from_csv, get_tomorrow_weather, forecast_next_day_kwh]
+    A token provider (rather than credential=) is passed so Entra tokens are
+    refreshed per request instead of being fixed at construction and expiring.
+    """
+    return AzureOpenAIChatClient(
+        ad_token_provider=get_bearer_token_provider(AzureCliCredential(), COGNITIVE_SERVICES_SCOPE)
     )
 
 
+@lru_cache(maxsize=1)
 def create_recommendation_agent():
     instructions = """
 You are the RecommendationAgent.
 
-- Take last usage vs. tomorrow's forecast from UsageCollectorAgent.
+- Take last usage vs. tomorrow's forecast from the collected usage data.
+- Use the household profile (peak/off-peak rates and peak hours) when estimating cost savings.
 - Suggest optimized settings for ALL appliances.
 - Be very mindful while generating the recommendations, please try to adhere to the actual realtime conditions, check its its feasible or practical to use the recommendation in real life scenario
 - Dont be blunt in generating the optimize plan, if there is not opportunity to save, please say it, no need to force fit the recommendations
@@ -225,23 +324,59 @@ You are the RecommendationAgent.
   ]
 }
 """
-    client = AzureOpenAIChatClient(credential=AzureCliCredential())
-    return client.create_agent(instructions=instructions)
+    return _chat_client().create_agent(instructions=instructions)
 
 
 
 # -------------------------------
 # Agent Execution
 # -------------------------------
-async def run_agents(profile: HomeProfile) -> dict:
-    # Initialize agents
-    collector_agent = create_usage_collector_agent()
-    recommender_agent = create_recommendation_agent()
+async def run_agent_json(agent, prompt: str) -> Dict[str, Any]:
+    """Stream an agent reply and parse it as soon as a complete JSON object arrives.
 
+    Tracks brace depth (ignoring braces inside JSON strings) over the streamed
+    text; once the first top-level object closes, the stream is closed and the
+    buffered text is parsed, so the tail of the completion is never awaited.
+    """
+    chunks: List[str] = []
+    depth = 0
+    in_string = escaped = False
+    async with aclosing(agent.run_stream(prompt)) as stream:
+        async for update in stream:
+            text = update.text or ""
+            chunks.append(text)
+            for ch in text:
+                if in_string:
+                    if escaped:
+                        escaped = False
+                    elif ch == "\\":
+                        escaped = True
+                    elif ch == '"':
+                        in_string = False
+                elif ch == '"' and depth:
+                    in_string = True
+                elif ch == "{":
+                    depth += 1
+                elif ch == "}" and depth:
+                    depth -= 1
+                    if depth == 0:
+                        try:
+                            return safe_json_extract("".join(chunks))
+                        except ValueError:
+                            # braces in leading prose; keep streaming
+                            pass
+    return safe_json_extract("".join(chunks))
+
+
+async def run_agents(profile: HomeProfile, refresh: bool = False) -> dict:
+    """Collect inputs and return the recommendation plan.
+
+    refresh=True skips the cached recommendation and replaces it with a new one.
+    """
     # Resolve city -> lat/lon on the backend if a city was provided
     try:
         if getattr(profile, "city", None):
-            geores = geocode_city(profile.city)
+            geores = await geocode_city(profile.city)
             if geores:
                 sel = geores[0]
                 try:
@@ -254,28 +389,68 @@ async def run_agents(profile: HomeProfile) -> dict:
         # ignore geocoding failures and continue with defaults
         pass
 
-    # Prepare initial prompt
-    tomorrow = datetime.now() + timedelta(days=1)
-    raw_prompt = json.dumps({
-        "csv_path": CSV_PATH,
-        "profile": profile.__dict__,
-        "tomorrow_iso": iso_date(tomorrow),
-        "is_weekend": 1 if tomorrow.weekday() >= 5 else 0,
-    })
-
-    # Execute usage collector agent
-    collector_result = await collector_agent.run(f"Collect required info: {raw_prompt}")
-    collector_data = safe_json_extract(collector_result.text)
+    tomorrow = local_tomorrow(profile.timezone)
+    tomorrow_iso = iso_date(tomorrow)
+    is_weekend = 1 if tomorrow.weekday() >= 5 else 0
+    appliances = [a for a in profile.appliances_present if a in MODEL_PATHS]
+    skipped = [a for a in profile.appliances_present if a not in MODEL_PATHS]
+    if skipped:
+        print("skipping appliances without a model: ", skipped)
+
+    # Collect usage, weather and appliance forecasts directly and concurrently;
+    # the CSV read overlaps the weather call, and all appliances are forecast
+    # in one batch once the average temperature is known.
+    try:
+        async with asyncio.TaskGroup() as tg:
+            usage_t = tg.create_task(asyncio.to_thread(get_last_usage_from_csv, CSV_PATH))
+            weather = await get_tomorrow_weather(
+                profile.latitude, profile.longitude, profile.timezone, tomorrow
+            )
+            avg_temp = (weather["temp_high"] + weather["temp_low"]) / 2
+            forecasts_t = tg.create_task(asyncio.to_thread(
+                predict_batch, appliances, tomorrow_iso, avg_temp, profile.hh_size, is_weekend
+            ))
+    except ExceptionGroup as eg:
+        # surface the first underlying error rather than the group wrapper
+        raise eg.exceptions[0]
+
+    # Only what the recommender needs: household/tariff fields (location is
+    # already folded into the weather) and point forecasts without intervals
+    collector_data = {
+        # appliances_present is narrowed to those with a forecast
+        "profile": {
+            **{k: getattr(profile, k) for k in RECOMMENDER_PROFILE_FIELDS},
+            "appliances_present": appliances,
+        },
+        "last_usage": usage_t.result(),
+        "weather": weather,
+        "forecasts": [
+            {"appliance": f["appliance"], "predicted_kwh": f["predicted_kwh"]}
+            for f in forecasts_t.result()
+        ],
+    }
     print("collector_result: ", collector_data)
 
-    # Feed raw collector output to recommendation agent
-    rec_input = json.dumps(collector_data)
-    recommender_result = await recommender_agent.run(f"Analyze and recommend: {rec_input}")
-    return safe_json_extract(recommender_result.text)
+    # Identical inputs within the same day reuse the earlier recommendation
+    cache_key = _recommendation_cache_key(collector_data)
+    cached = None if refresh else _RECOMMENDATION_CACHE.get(cache_key)
+    if cached is not None:
+        return cached
+
+    # Feed collected data to recommendation agent
+    recommender_agent = create_recommendation_agent()
+    rec_input = orjson.dumps(collector_data).decode()
+    plan = await run_agent_json(recommender_agent, f"Analyze and recommend: {rec_input}")
+    # Only cache something shaped like a plan; a malformed reply is retried next call
+    if isinstance(plan, dict) and isinstance(plan.get("actions"), list):
+        _RECOMMENDATION_CACHE[cache_key] = plan
+    else:
+        _RECOMMENDATION_CACHE.pop(cache_key, None)
+    return plan
 
 
 def run_agent(profile: HomeProfile) -> dict:
-    """Wrapper sync method to launch async agent runs."""
+    """Sync wrapper for CLI use; the API awaits run_agents on its own loop."""
     return asyncio.run(run_agents(profile))
 
 if __name__=='__main__':
@@ -290,5 +465,5 @@ if __name__=='__main__':
         appliances_present=["Air Conditioning", "Washing Machine", "Dishwasher", "Microwave", "Computer"]
     )
     output = run_agent(profile)
-    print(json.dumps(output, indent=2))
+    print(orjson.dumps(output, option=orjson.OPT_INDENT_2).decode())
 
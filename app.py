@@ -3,21 +3,37 @@ app.py
 -------
 FastAPI backend that exposes:
 - /optimize-energy → Agentic energy-saving optimization (via agent.py)
-- /email-plan      → Format plan into email and send (via email_agent.py)
+- /email-plan      → Queue plan formatting + email send in the background (via email_agent.py)
 """
 
-from fastapi import FastAPI, HTTPException
+from contextlib import asynccontextmanager
+
+import msgspec
+from fastapi import BackgroundTasks, FastAPI, HTTPException, Request
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import ORJSONResponse
 from pydantic import BaseModel, EmailStr
 from datetime import datetime
 
-from agent import run_agent, HomeProfile
+from agent import run_agents, HomeProfile, close_http_client
 from email_agent import generate_email_and_send_async  # Updated for async usage
 
 # -------------------------------
 # App Setup
 # -------------------------------
-app = FastAPI(title="Home Energy Saver API", version="2.4.1")
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    yield
+    # Release pooled outbound HTTP connections
+    await close_http_client()
+
+
+app = FastAPI(
+    title="Home Energy Saver API",
+    version="2.4.1",
+    lifespan=lifespan,
+    default_response_class=ORJSONResponse,
+)
 
 app.add_middleware(
     CORSMiddleware,
@@ -29,9 +45,10 @@ app.add_middleware(
 
 
 # -------------------------------
-# Pydantic Models
+# Request Models
 # -------------------------------
-class OptimizeEnergyRequest(BaseModel):
+class OptimizeEnergyRequest(msgspec.Struct, kw_only=True):
+    """Decoded with msgspec (C validator) on the hot /optimize-energy path."""
     hh_size: int
     appliances_present: list[str]
     latitude: float = 18.6298
@@ -42,21 +59,22 @@ class OptimizeEnergyRequest(BaseModel):
     tariff_peak_start: str = "18:00"
     tariff_peak_end: str = "22:00"
 
-    model_config = {
-        "json_schema_extra": {
-            "example": {
-                "hh_size": 4,
-                "appliances_present": ["Air Conditioning", "Microwave", "Computer"],
-                "latitude": 18.6298,
-                "longitude": 73.7997,
-                "timezone": "Asia/Kolkata",
-                "rate_peak": 12.0,
-                "rate_offpeak": 7.5,
-                "tariff_peak_start": "18:00",
-                "tariff_peak_end": "22:00"
-            }
-        }
-    }
+
+# OpenAPI request body for /optimize-energy, generated from the msgspec Struct
+OPTIMIZE_ENERGY_SCHEMA = {
+    **msgspec.json.schema_components([OptimizeEnergyRequest])[1]["OptimizeEnergyRequest"],
+    "example": {
+        "hh_size": 4,
+        "appliances_present": ["Air Conditioning", "Microwave", "Computer"],
+        "latitude": 18.6298,
+        "longitude": 73.7997,
+        "timezone": "Asia/Kolkata",
+        "rate_peak": 12.0,
+        "rate_offpeak": 7.5,
+        "tariff_peak_start": "18:00",
+        "tariff_peak_end": "22:00"
+    },
+}
 
 
 class EmailPlanRequest(BaseModel):
@@ -125,32 +143,57 @@ def index():
         "docs": "/docs"
     }
 
-@app.post("/optimize-energy", summary="Generate energy optimization plan", tags=["Agentic AI"])
-def optimize_energy(req: OptimizeEnergyRequest):
+@app.post(
+    "/optimize-energy",
+    summary="Generate energy optimization plan",
+    tags=["Agentic AI"],
+    openapi_extra={
+        "requestBody": {
+            "required": True,
+            "content": {"application/json": {"schema": OPTIMIZE_ENERGY_SCHEMA}},
+        }
+    },
+)
+async def optimize_energy(request: Request, refresh: bool = False):
     """
     Orchestrates the entire agent workflow and returns structured results.
+    Pass ?refresh=true to bypass the cached recommendation for these inputs.
     """
     try:
-        profile = HomeProfile(**req.dict())
-        return run_agent(profile)
+        # strict=False keeps Pydantic's lax coercion ("4", 4.0 -> 4; "12" -> 12.0)
+        req = msgspec.json.decode(await request.body(), type=OptimizeEnergyRequest, strict=False)
+    except msgspec.DecodeError as e:
+        raise HTTPException(status_code=422, detail=f"Invalid request: {e}")
+
+    try:
+        profile = HomeProfile(**msgspec.structs.asdict(req))
+        # Await on the server loop so the shared HTTP client's pool stays valid
+        return await run_agents(profile, refresh=refresh)
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Agent Error: {e}")
 
 
 @app.post("/email-plan", summary="Format and send plan via email", tags=["Email"])
-async def email_plan(req: EmailPlanRequest):
+async def email_plan(req: EmailPlanRequest, background_tasks: BackgroundTasks):
     """
-    Uses the email agent to format and send a plan over email.
+    Queues the email agent to format and send a plan, returning immediately.
     """
-    try:
-        return await generate_email_and_send_async(req.plan_json, req.email, req.name)
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Email Error: {e}")
+    background_tasks.add_task(generate_email_and_send_async, req.plan_json, req.email, req.name)
+    return {"status": "queued", "email": req.email}
 
 
 # -------------------------------
 # Local Run
 # -------------------------------
 if __name__ == "__main__":
+    import os
     import uvicorn
-    uvicorn.run(app, host="0.0.0.0", port=8000)
+    # Multiple workers need the import string; "auto" picks uvloop/httptools when installed
+    uvicorn.run(
+        "app:app",
+        host="0.0.0.0",
+        port=8000,
+        workers=int(os.getenv("API_WORKERS", os.cpu_count() or 1)),
+        loop="auto",
+        http="auto",
+    )
@@ -8,14 +8,17 @@ Run:
     python email_agent.py
 """
 
-import json
 import smtplib
 import asyncio
+import threading
 from email.mime.text import MIMEText
 from functools import lru_cache
+from typing import Optional
+
+import orjson
 
 from agent_framework.azure import AzureOpenAIChatClient
-from azure.identity import AzureCliCredential
+from azure.identity import AzureCliCredential, get_bearer_token_provider
 
 # -------------------------------
 # SMTP CONFIG — replace with your own
@@ -25,14 +28,22 @@ SMTP_PORT = 587
 EMAIL_SENDER = "your-email-id"          # <-- CHANGE
 EMAIL_PASSWORD = "your-email-token"      # <-- CHANGE (Gmail App Password)
 
+# Long-lived SMTP connection shared across sends (TLS + AUTH paid once)
+_SMTP_LOCK = threading.Lock()
+_SMTP: Optional[smtplib.SMTP] = None
+
 
+@lru_cache(maxsize=1)
 def get_email_agent():
     """
     Create and cache a lightweight email-formatting agent.
     Using MAF agent.run avoids low-level message object quirks.
     """
+    # A token provider keeps the cached client's Entra token refreshed
     client = AzureOpenAIChatClient(
-        credential=AzureCliCredential(),
+        ad_token_provider=get_bearer_token_provider(
+            AzureCliCredential(), "https://cognitiveservices.azure.com/.default"
+        ),
         deployment="gpt-4o-mini"  # ensure this deployment exists in your Azure OpenAI resource
     )
 
@@ -60,15 +71,11 @@ async def generate_email_body_async(plan_json: dict, recipient_name: str = "User
     Uses the MAF agent to transform plan JSON into a plain-text email body.
     """
     agent = get_email_agent()
-    payload = {
-        "recipient_name": recipient_name,
-        "plan_json": plan_json,
-    }
-    # Give the model clear, single-turn input
+    # Give the model clear, single-turn input (compact JSON keeps the token count down)
     user_prompt = (
         "Format this energy-saving plan into an email.\n\n"
         f"Recipient: {recipient_name}\n\n"
-        f"Plan JSON:\n{json.dumps(plan_json, indent=2)}\n\n"
+        f"Plan JSON:\n{orjson.dumps(plan_json).decode()}\n\n"
         "Return plain text email only."
     )
     result = await agent.run(user_prompt)
@@ -83,19 +90,58 @@ async def generate_email_body_async(plan_json: dict, recipient_name: str = "User
 # -------------------------------
 # SMTP SEND
 # -------------------------------
+def _smtp_connection() -> smtplib.SMTP:
+    """
+    Returns a live, authenticated SMTP connection, reconnecting if the
+    pooled one was dropped by the server. Caller must hold _SMTP_LOCK.
+    """
+    global _SMTP
+    if _SMTP is not None:
+        try:
+            if _SMTP.noop()[0] == 250:
+                return _SMTP
+        except (smtplib.SMTPException, OSError):
+            pass
+        _reset_smtp()
+
+    server = smtplib.SMTP(SMTP_SERVER, SMTP_PORT)
+    try:
+        server.starttls()
+        server.login(EMAIL_SENDER, EMAIL_PASSWORD)
+    except Exception:
+        server.close()
+        raise
+    _SMTP = server
+    return server
+
+
+def _reset_smtp() -> None:
+    """Closes and forgets the pooled connection. Caller must hold _SMTP_LOCK."""
+    global _SMTP
+    if _SMTP is not None:
+        try:
+            _SMTP.close()
+        except Exception:
+            pass
+    _SMTP = None
+
+
 def send_email(subject: str, body: str, recipient: str):
     """
-    Sends a plain text email via SMTP.
+    Sends a plain text email via SMTP, reusing the pooled connection.
     """
     msg = MIMEText(body, _charset="utf-8")
     msg["Subject"] = subject
     msg["From"] = EMAIL_SENDER
     msg["To"] = recipient
 
-    with smtplib.SMTP(SMTP_SERVER, SMTP_PORT) as server:
-        server.starttls()
-        server.login(EMAIL_SENDER, EMAIL_PASSWORD)
-        server.sendmail(EMAIL_SENDER, [recipient], msg.as_string())
+    with _SMTP_LOCK:
+        try:
+            _smtp_connection().sendmail(EMAIL_SENDER, [recipient], msg.as_string())
+        except smtplib.SMTPServerDisconnected:
+            # connection dropped between the liveness check and the send; retry once
+            _reset_smtp()
+            _smtp_connection().sendmail(EMAIL_SENDER, [recipient], msg.as_string())
 
 
 # -------------------------------
@@ -107,7 +153,8 @@ async def generate_email_and_send_async(plan_json: dict, to_email: str, recipien
     """
     body = await generate_email_body_async(plan_json, recipient_name=recipient_name)
     subject = "Your Home Energy Optimization Report"
-    send_email(subject, body, to_email)
+    # smtplib is blocking; keep the event loop free while sending
+    await asyncio.to_thread(send_email, subject, body, to_email)
     return {"status": "sent", "email": to_email}
 
 
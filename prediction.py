@@ -5,7 +5,10 @@ Contains reusable functions for loading Prophet models
 and forecasting next-day kWh for a specific appliance.
 """
 
+from functools import lru_cache
 from pathlib import Path
+from types import MappingProxyType
+from typing import List
 import json
 import pickle
 import pandas as pd
@@ -21,6 +24,58 @@ if not REGISTRY_FILE.exists():
 with open(REGISTRY_FILE, "r") as f:
     MODEL_REGISTRY = json.load(f)
 
+# Appliance -> absolute model path, resolved once (absolute registry paths win the join)
+MODEL_PATHS = MappingProxyType({
+    appliance: (ARTIFACT_DIR / meta["model_path"]).resolve()
+    for appliance, meta in MODEL_REGISTRY.items()
+})
+
+
+@lru_cache(maxsize=None)
+def _load_model(appliance: str):
+    """Unpickles the Prophet model for an appliance once per process."""
+    model_path = MODEL_PATHS[appliance]
+    try:
+        with open(model_path, "rb") as f:
+            return pickle.load(f)
+    except FileNotFoundError:
+        raise FileNotFoundError(f"Model file not found at: {model_path}") from None
+
+
+@lru_cache(maxsize=32)
+def _feature_frame(ds_next: str, avg_temp: float, hh_size: float, is_weekend: int) -> pd.DataFrame:
+    """Builds the single-row Prophet input column-wise (no per-row dict/record parsing).
+
+    Cached so a batch of appliances shares one frame; Prophet copies its
+    input before transforming it, so the shared frame is never mutated.
+    """
+    return pd.DataFrame({
+        "ds": [pd.Timestamp(ds_next)],
+        "avg_temp": [avg_temp],
+        "hh_size": [hh_size],
+        "is_weekend": [is_weekend],
+    })
+
+
+@lru_cache(maxsize=256)
+def _forecast(
+    appliance: str,
+    ds_next: str,
+    avg_temp: float,
+    hh_size: float,
+    is_weekend: int
+) -> tuple:
+    """Returns (yhat, yhat_lower, yhat_upper); memoized so identical re-forecasts are free."""
+    # load model (cached after the first call)
+    model = _load_model(appliance)
+
+    pred = model.predict(_feature_frame(ds_next, avg_temp, hh_size, is_weekend))
+    return (
+        float(pred.loc[0, "yhat"]),
+        float(pred.loc[0, "yhat_lower"]),
+        float(pred.loc[0, "yhat_upper"]),
+    )
+
 
 def predict_next_day_kwh(
     appliance: str,
@@ -30,37 +85,37 @@ def predict_next_day_kwh(
     is_weekend: int
 ) -> dict:
     """Forecasts next-day kWh for given appliance using Prophet."""
-    if appliance not in MODEL_REGISTRY:
+    if appliance not in MODEL_PATHS:
         raise ValueError(f"No model found for appliance: {appliance}")
 
-    # load model
-    raw_path = MODEL_REGISTRY[appliance]["model_path"]
-    model_path = Path(raw_path)
-    if not model_path.is_absolute():
-        model_path = ARTIFACT_DIR / model_path
-
-    if not model_path.exists():
-        raise FileNotFoundError(f"Model file not found at: {model_path}")
-
-    with open(model_path, "rb") as f:
-        model = pickle.load(f)
-
-    df = pd.DataFrame([{
-        "ds": pd.to_datetime(ds_next),
-        "avg_temp": float(avg_temp),
-        "hh_size": float(hh_size),
-        "is_weekend": int(is_weekend)
-    }])
-
-    pred = model.predict(df)
+    yhat, lower, upper = _forecast(
+        appliance, ds_next, float(avg_temp), float(hh_size), int(is_weekend)
+    )
     return {
         "appliance": appliance,
         "date": ds_next,
-        "predicted_kwh": float(pred.loc[0, "yhat"]),
-        "ci_lower": float(pred.loc[0, "yhat_lower"]),
-        "ci_upper": float(pred.loc[0, "yhat_upper"])
+        "predicted_kwh": yhat,
+        "ci_lower": lower,
+        "ci_upper": upper
     }
 
+def predict_batch(
+    appliances: List[str],
+    ds_next: str,
+    avg_temp: float,
+    hh_size: float,
+    is_weekend: int
+) -> List[dict]:
+    """Forecasts next-day kWh for several appliances sharing the same inputs."""
+    missing = [a for a in appliances if a not in MODEL_PATHS]
+    if missing:
+        raise ValueError(f"No model found for appliance(s): {', '.join(missing)}")
+
+    return [
+        predict_next_day_kwh(a, ds_next, avg_temp, hh_size, is_weekend)
+        for a in appliances
+    ]
+
 # ----------------------------------------
 # Local Test: Run prediction directly
 # ----------------------------------------
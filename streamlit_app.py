@@ -7,22 +7,46 @@
 # -----------------------------------------
 
 import os
+import html
 import json
-import requests
+from functools import lru_cache
+
+import httpx
 import streamlit as st
-from datetime import datetime
-import pytz
+from datetime import date, time
 
 try:
-    import plotly.graph_objects as go
-    PLOTLY_OK = True
+    import orjson
+    _dumps = orjson.dumps
+    _loads = orjson.loads
 except Exception:
-    PLOTLY_OK = False
+    # orjson wheel unavailable: stdlib fallback with the same bytes-out shape
+    def _dumps(obj) -> bytes:
+        return json.dumps(obj, separators=(",", ":")).encode("utf-8")
+    _loads = json.loads
+
+JSON_HEADERS = {"Content-Type": "application/json"}
+
+@lru_cache(maxsize=1)
+def _go():
+    """Import Plotly on first use (it is slow to import); None when it is not installed."""
+    try:
+        import plotly.graph_objects as go
+    except Exception:
+        return None
+    return go
+
+def plotly_ok() -> bool:
+    return _go() is not None
 
 # -------------------------------
 # Config + constants
 # -------------------------------
 BACKEND_BASE_URL = os.getenv("BACKEND_BASE_URL", "http://localhost:8000")
+# Bump when the optimizer response shape changes so plans persisted on disk are invalidated
+PLAN_CACHE_VERSION = 1
+# Last day the persisted plan cache was pruned (survives restarts like the cache itself)
+PLAN_CACHE_DAY_FILE = os.path.join(".streamlit", "plan_cache_day")
 
 APPLIANCE_CHOICES = [
     "Air Conditioning", "Washing Machine", "Dishwasher", "Microwave",
@@ -42,22 +66,203 @@ TIMEZONES = [
     "Asia/Kolkata", "UTC", "Europe/London", "America/New_York",
     "Asia/Singapore", "Australia/Sydney", "Europe/Berlin"
 ]
+# Nominatim country filter per timezone (UTC has none)
+TIMEZONE_COUNTRY = {
+    "Asia/Kolkata": "in", "Europe/London": "gb", "America/New_York": "us",
+    "Asia/Singapore": "sg", "Australia/Sydney": "au", "Europe/Berlin": "de",
+}
+
+# Savings keys in priority order (optimizer versions differ in naming)
+_KWH_KEYS = ("expected_kwh_saving", "estimated_kwh_saving")
+_COST_KEYS = ("expected_cost_saving", "estimated_cost_saving")
+# Forecast fields shown by default; the interval bounds are left to the raw view
+_FC_KEYS = ("appliance", "date", "predicted_kwh")
+
+# Static page chrome, built once at module level and emitted in a single
+# markdown element per rerun (Streamlit drops elements that are not re-emitted,
+# so these cannot be skipped on later reruns).
+HEADER_HTML = """
+<div style="display:flex;flex-direction:column;align-items:center;justify-content:center;margin-bottom:12px;">
+  <div style="padding:8px 16px;border-radius:999px;background:linear-gradient(90deg, #cce5ff, #b3d9ff);border:1px solid #99ccff;color:#003366;font-weight:bold;">
+    🌟 Agentic AI 🌟
+  </div>
+  <div style="color:#33475b;margin-top:10px;font-size:14px;text-align:center;max-width:720px;">
+    Harness the power of <span style="color:#007acc;font-weight:bold;">Agentic AI</span> to predict tomorrow’s energy usage, optimize your settings, and automate daily reports effortlessly.
+  </div>
+</div>
+"""
+
+PAGE_CSS = """
+<style>
+body {
+    background: linear-gradient(180deg, #eaf3ff 0%, #f4fff8 100%);
+    font-family: 'Segoe UI', Roboto, Arial, sans-serif;
+    color: #2a2e35;
+}
+.stApp {
+    padding: 16px;
+}
+h1 {
+    font-size: 1.6rem !important;
+    font-weight: 700;
+}
+.metric {
+    font-size: 0.9rem !important;
+}
+.subtitle {
+    color: #63748a;
+    font-size: 0.95rem;
+}
+.gauge-container {
+    max-width: 260px;
+    margin: 0 auto;
+}
+.stPlotlyChart {
+    padding: 6px !important;
+}
+/* Stylish green-gradient buttons for main actions */
+.stButton > button {
+    background: linear-gradient(90deg, #16a34a 0%, #4ade80 100%);
+    color: #ffffff;
+    border: none;
+    padding: 10px 18px;
+    border-radius: 12px;
+    font-weight: 600;
+    font-size: 0.98rem;
+    box-shadow: 0 8px 20px rgba(16,185,129,0.14);
+    transition: transform 0.12s ease, box-shadow 0.12s ease, opacity 0.12s ease;
+    cursor: pointer;
+    width: 100%;
+}
+.stButton > button:hover:not(:disabled) {
+    transform: translateY(-3px);
+    box-shadow: 0 14px 34px rgba(16,185,129,0.18);
+    opacity: 0.98;
+}
+.stButton > button:active:not(:disabled) {
+    transform: translateY(0);
+    box-shadow: 0 6px 14px rgba(16,185,129,0.12);
+}
+.stButton > button[disabled], .stButton > button[aria-disabled="true"] {
+    background: linear-gradient(90deg,#eef6ef 0%, #f7fbf7 100%);
+    color: #9aa7a0;
+    border: 1px solid #e6f3ea;
+    box-shadow: none;
+    cursor: default;
+}
+/* Recommendation cards */
+.action-card {
+    background: linear-gradient(90deg, #f7faff 0%, #eef2ff 100%);
+    border: 1px solid #dee3f0;
+    padding: 12px;
+    border-radius: 12px;
+    margin-bottom: 10px;
+    line-height: 1.7;
+}
+/* Inline spinner for button-level feedback */
+.inline-spinner {
+    border: 3px solid rgba(0,0,0,0.06);
+    border-top: 3px solid #16a34a;
+    border-radius: 50%;
+    width: 16px;
+    height: 16px;
+    display: inline-block;
+    vertical-align: middle;
+    animation: spin 1s linear infinite;
+    margin-right: 6px;
+}
+@keyframes spin { 0% { transform: rotate(0deg); } 100% { transform: rotate(360deg); } }
+@media (max-width: 600px) {
+    h1 { font-size: 1.2rem !important; }
+    .gauge-container { max-width: 220px; }
+}
+</style>
+"""
+
+SPACER_HTML = """
+<div style="text-align: center; padding: 16px 0;">
+    <div class="subtitle" style="font-size: 1.1rem; color: #33475b; margin-top: 8px;">
+    </div>
+</div>
+"""
+
+FOOTER_HTML = """
+<div style="text-align:center;color:#94a3b8;margin-top:30px;font-size:0.85rem;">
+  Built with ❤️ using FastAPI · Microsoft Agent Framework · Streamlit
+</div>
+"""
 
 # -------------------------------
 # Helper functions
 # -------------------------------
-def post_optimize_energy(payload: dict) -> dict:
-    url = f"{BACKEND_BASE_URL}/optimize-energy"
-    resp = requests.post(url, json=payload, timeout=60)
+@st.cache_resource
+def http_client() -> httpx.Client:
+    """Shared keep-alive HTTP/2 client (cached across reruns).
+
+    Connections, TLS handshakes and DNS lookups are amortized across clicks;
+    HTTPS hosts that speak HTTP/2 (e.g. Nominatim) get multiplexed streams
+    and header compression.
+    """
+    return httpx.Client(
+        http2=True,
+        timeout=60.0,
+        limits=httpx.Limits(max_connections=8, max_keepalive_connections=4),
+        headers={"User-Agent": "HomeEnergySaver/1.0 (+https://example.com)"},
+    )
+
+def _post_json(path: str, payload: dict) -> dict:
+    """POST a JSON body to the backend and decode the reply straight from bytes.
+
+    The body is pre-serialized to bytes and the response is parsed from
+    resp.content, skipping the str decode and stdlib json round-trip.
+    """
+    resp = http_client().post(
+        f"{BACKEND_BASE_URL}{path}", content=_dumps(payload), headers=JSON_HEADERS
+    )
     resp.raise_for_status()
-    return resp.json()
+    return _loads(resp.content)
+
+def post_optimize_energy(payload: dict, refresh: bool = False) -> dict:
+    # refresh asks the backend to skip its own cached recommendation too
+    return _post_json("/optimize-energy?refresh=true" if refresh else "/optimize-energy", payload)
+
+@st.cache_data(persist="disk", max_entries=256, show_spinner="Calling optimizer…")
+def get_plan(req: dict, version: int, day: str, _refresh: bool = False) -> dict:
+    """Optimizer call cached on disk so plans survive server restarts.
+
+    Persisted caches ignore ttl, so the plan is keyed on the calendar day
+    (the plan is for tomorrow) and on PLAN_CACHE_VERSION instead. _refresh is
+    not part of the key (leading underscore); it is forwarded to the backend.
+    """
+    return post_optimize_energy(req, refresh=_refresh)
+
+def prune_stale_plans(day: str) -> None:
+    """Drop earlier days' persisted plans the first time a new day is seen.
+
+    max_entries only bounds the in-memory layer; the .memo files on disk are
+    never pruned by Streamlit, so they are cleared here once per day.
+    """
+    try:
+        with open(PLAN_CACHE_DAY_FILE, encoding="utf-8") as f:
+            if f.read().strip() == day:
+                return
+    except OSError:
+        pass
+    get_plan.clear()
+    os.makedirs(os.path.dirname(PLAN_CACHE_DAY_FILE), exist_ok=True)
+    with open(PLAN_CACHE_DAY_FILE, "w", encoding="utf-8") as f:
+        f.write(day)
 
 def post_email_plan(plan: dict, email: str, name: str) -> dict:
-    url = f"{BACKEND_BASE_URL}/email-plan"
-    payload = {"plan_json": plan, "email": email, "name": name}
-    resp = requests.post(url, json=payload, timeout=60)
-    resp.raise_for_status()
-    return resp.json()
+    return _post_json("/email-plan", {"plan_json": plan, "email": email, "name": name})
+
+def _first(d: dict, keys: tuple, default=None):
+    """Return the value of the first key in `keys` present (non-None) in `d`."""
+    for k in keys:
+        v = d.get(k)
+        if v is not None:
+            return v
+    return default
 
 def kpi_from_plan(plan: dict):
     kwh = None
@@ -66,34 +271,28 @@ def kpi_from_plan(plan: dict):
     total_cost = 0.0
     currency = "INR"
     if isinstance(plan, dict):
-        if "plan" in plan and isinstance(plan["plan"], dict) and "summary" in plan["plan"]:
-            s = plan["plan"]["summary"]
-            kwh = s.get("kwh")
-            cost = s.get("cost")
-            currency = s.get("currency", currency)
-        elif "summary" in plan and isinstance(plan["summary"], dict):
-            s = plan["summary"]
+        # Resolve the container once: plans may be wrapped as {"plan": {...}}
+        nested = plan.get("plan")
+        root = nested if isinstance(nested, dict) else plan
+
+        s = root.get("summary")
+        if not isinstance(s, dict):
+            s = plan.get("summary")
+        if isinstance(s, dict):
             kwh = s.get("kwh")
             cost = s.get("cost")
             currency = s.get("currency", currency)
 
-        actions = plan.get("plan", {}).get("actions", []) or plan.get("actions", [])
+        actions = root.get("actions") or plan.get("actions") or ()
+        first = _first
         for action in actions:
-            total_kwh += action.get("expected_kwh_saving", 0) or action.get("estimated_kwh_saving", 0)
-            total_cost += action.get("expected_cost_saving", 0) or action.get("estimated_cost_saving", 0)
+            total_kwh += first(action, _KWH_KEYS, 0)
+            total_cost += first(action, _COST_KEYS, 0)
 
     return kwh, cost, currency, total_kwh, total_cost
 
-def render_gauge_kwh(value: float, title: str = "Estimated kWh Saved", unit: str = "kWh"):
-    """Render a Plotly gauge with a number suffix showing the unit and a thin threshold line as an indicator.
-
-    Args:
-        value: numeric value to display
-        title: gauge title
-        unit: unit string to add as suffix to the number (e.g., 'kWh' or '₹')
-    """
-    if not PLOTLY_OK:
-        return None
+def _gauge_scale(value) -> tuple:
+    """Return (value, axis max, threshold) for a gauge, tolerating missing/non-numeric input."""
     try:
         val = float(value or 0)
     except Exception:
@@ -104,54 +303,108 @@ def render_gauge_kwh(value: float, title: str = "Estimated kWh Saved", unit: str
 
     # Threshold value must lie within axis range
     thr_val = max(0.0, min(val, max_range))
+    return val, max_range, thr_val
+
+def _gauge_indicator(title: str, unit: str):
+    """Build one gauge trace with a number suffix showing the unit and a thin threshold line as an indicator.
 
-    fig = go.Figure(
-        go.Indicator(
-            mode="gauge+number",
-            value=val,
-            number={"font": {"size": 16}, "suffix": f" {unit}"},
-            title={"text": title, "font": {"size": 14}},
-            gauge={
-                "axis": {"range": [0, max_range]},
-                # visible bar keeps a filled feel; threshold line acts as a needle/arrow indicator
-                "bar": {"color": "#16a34a", "thickness": 0.35},
-                "threshold": {
-                    "line": {"color": "#065f46", "width": 6},
-                    "thickness": 0.8,
-                    "value": thr_val,
-                },
+    Args:
+        title: gauge title
+        unit: unit string to add as suffix to the number (e.g., 'kWh' or '₹')
+    """
+    return _go().Indicator(
+        mode="gauge+number",
+        value=0.0,
+        number={"font": {"size": 16}, "suffix": f" {unit}"},
+        title={"text": title, "font": {"size": 14}},
+        gauge={
+            "axis": {"range": [0, 1.0]},
+            # visible bar keeps a filled feel; threshold line acts as a needle/arrow indicator
+            "bar": {"color": "#16a34a", "thickness": 0.35},
+            "threshold": {
+                "line": {"color": "#065f46", "width": 6},
+                "thickness": 0.8,
+                "value": 0.0,
             },
-        )
+        },
     )
-    fig.update_layout(margin=dict(t=15, b=5, l=5, r=5), height=180)
+
+def _dual_gauge_template():
+    """Build the static dual-gauge figure once per session.
+
+    Constructing and validating the full figure is the expensive part, so later
+    renders only patch values. Kept in session state rather than st.cache_resource
+    because the figure is mutated per render and must not be shared across sessions.
+    """
+    fig = st.session_state.get("_gauge_fig")
+    if fig is None:
+        from plotly.subplots import make_subplots
+        fig = make_subplots(rows=1, cols=2, specs=[[{"type": "indicator"}, {"type": "indicator"}]])
+        fig.add_trace(_gauge_indicator("kWh Saved", unit="kWh"), row=1, col=1)
+        # Use currency symbol as unit for the cost gauge
+        fig.add_trace(_gauge_indicator("₹ Saved", unit="₹"), row=1, col=2)
+        fig.update_layout(margin=dict(t=15, b=5, l=5, r=5), height=180)
+        st.session_state["_gauge_fig"] = fig
+    return fig
+
+def render_dual_gauge(total_kwh: float, total_cost: float):
+    """Render the kWh and cost gauges side by side in a single Plotly figure (one chart payload)."""
+    if not plotly_ok():
+        return None
+    fig = _dual_gauge_template()
+    for trace, value in zip(fig.data, (total_kwh, total_cost)):
+        val, max_range, thr_val = _gauge_scale(value)
+        trace.value = val
+        trace.gauge.axis.range = [0, max_range]
+        trace.gauge.threshold.value = thr_val
     return fig
 
+_fmt_rupees = "₹{:,.2f}".format
+
 def nice_rupees(x):
+    # Plain numbers (the common case) skip the float() coercion; x == x filters NaN
+    if isinstance(x, (int, float)) and x == x:
+        return _fmt_rupees(x)
     try:
-        return f"₹{float(x):,.2f}"
+        return _fmt_rupees(float(x))
     except Exception:
         return "₹—"
 
 
-def geocode_city(query: str, max_results: int = 5) -> list:
-    """Return a list of geocoding matches for the given query using Nominatim.
-
-    Each item is a dict with keys: display_name, lat, lon.
+@st.cache_data(ttl=86400, max_entries=512, show_spinner=False)
+def _geocode_cached(query: str, countrycodes: str) -> list:
+    """Nominatim lookup behind Streamlit's cache; raises on failure so errors are never cached."""
+    url = "https://nominatim.openstreetmap.org/search"
+    # Only the top match is used, so ask for one result without address details
+    params = {"q": query, "format": "jsonv2", "limit": 1, "addressdetails": 0}
+    if countrycodes:
+        params["countrycodes"] = countrycodes
+    resp = http_client().get(url, params=params, timeout=10)
+    resp.raise_for_status()
+    data = _loads(resp.content)
+    results = []
+    for item in data:
+        results.append({
+            "display_name": item.get("display_name", ""),
+            "lat": item.get("lat"),
+            "lon": item.get("lon"),
+        })
+    return results
+
+
+def geocode_city(query: str, timezone: str = "") -> list:
+    """Return the best geocoding match for the given query using Nominatim.
+
+    The list holds at most one dict with keys: display_name, lat, lon. The
+    search is narrowed to the timezone's country and widened again if that
+    finds nothing. Results are cached per normalized query for a day.
     """
+    query = query.strip().lower()
     try:
-        url = "https://nominatim.openstreetmap.org/search"
-        params = {"q": query, "format": "json", "limit": max_results}
-        headers = {"User-Agent": "HomeEnergySaver/1.0 (+https://example.com)"}
-        resp = requests.get(url, params=params, headers=headers, timeout=10)
-        resp.raise_for_status()
-        data = resp.json()
-        results = []
-        for item in data:
-            results.append({
-                "display_name": item.get("display_name", ""),
-                "lat": item.get("lat"),
-                "lon": item.get("lon"),
-            })
+        countrycodes = TIMEZONE_COUNTRY.get(timezone, "")
+        results = _geocode_cached(query, countrycodes)
+        if not results and countrycodes:
+            results = _geocode_cached(query, "")
         return results
     except Exception:
         return []
@@ -167,34 +420,27 @@ def show_action_cards(plan: dict):
         st.warning("No actions were returned by the optimizer.")
         return
 
+    # Build every card into one HTML string so the page gets a single element
+    parts = []
+    first = _first
     for a in actions:
-        with st.container():
-            st.markdown(
-                """
-                <div style="background: linear-gradient(90deg, #f7faff 0%, #eef2ff 100%); 
-                            border:1px solid #dee3f0; padding:12px; border-radius:12px; margin-bottom:10px;">
-                """,
-                unsafe_allow_html=True
+        lines = [
+            f"<div><strong>🛠️ Appliance:</strong> {html.escape(str(a.get('appliance', '—')))}</div>",
+            f"<div><strong>💡 Recommendation:</strong> "
+            f"{html.escape(str(a.get('action') or a.get('recommendation', '—')))}</div>",
+        ]
+        s_kwh = first(a, _KWH_KEYS)
+        s_cost = first(a, _COST_KEYS)
+        currency = a.get("currency", "INR")
+        if s_kwh is not None or s_cost is not None:
+            savings = (
+                f"{(str(s_kwh)+' kWh') if s_kwh is not None else ''}"
+                f"{' • ' if (s_kwh is not None and s_cost is not None) else ''}"
+                f"{(nice_rupees(s_cost) if currency=='INR' else str(s_cost)) if s_cost is not None else ''}"
             )
-            cols = st.columns([0.85, 0.15])
-            with cols[0]:
-                st.markdown(
-                    f"**🛠️ Appliance:** {a.get('appliance', '—')}\n\n"
-                    f"**💡 Recommendation:** {a.get('action') or a.get('recommendation', '—')}"
-                )
-            with cols[1]:
-                st.markdown("&nbsp;")
-            s_kwh = a.get("expected_kwh_saving") or a.get("estimated_kwh_saving")
-            s_cost = a.get("expected_cost_saving") or a.get("estimated_cost_saving")
-            currency = a.get("currency", "INR")
-            if s_kwh is not None or s_cost is not None:
-                st.markdown(
-                    f"**📉 Estimated Savings:** "
-                    f"{(str(s_kwh)+' kWh') if s_kwh is not None else ''}"
-                    f"{' • ' if (s_kwh is not None and s_cost is not None) else ''}"
-                    f"{(nice_rupees(s_cost) if currency=='INR' else str(s_cost)) if s_cost is not None else ''}"
-                )
-            st.markdown("</div>", unsafe_allow_html=True)
+            lines.append(f"<div><strong>📉 Estimated Savings:</strong> {html.escape(savings)}</div>")
+        parts.append('<div class="action-card">' + "".join(lines) + "</div>")
+    st.markdown("\n".join(parts), unsafe_allow_html=True)
 
 def show_weather(plan: dict):
     w = plan.get("weather")
@@ -210,24 +456,15 @@ def show_forecasts(plan: dict):
     if not fcs:
         return
     st.markdown("### 📊 Appliance Forecasts")
+    # Ship only the forecast fields by default; the full dicts are opt-in
+    show_raw = st.checkbox("Show raw forecast JSON", value=False, key="show_raw_forecasts")
     for fc in fcs:
         with st.expander(f"🔎 {fc.get('appliance', 'Appliance')} — details"):
-            st.json(fc)
+            st.json(fc if show_raw else {k: fc[k] for k in _FC_KEYS if k in fc})
 
 def decorate_header():
-    st.markdown(
-        """
-        <div style="display:flex;flex-direction:column;align-items:center;justify-content:center;margin-bottom:12px;">
-          <div style="padding:8px 16px;border-radius:999px;background:linear-gradient(90deg, #cce5ff, #b3d9ff);border:1px solid #99ccff;color:#003366;font-weight:bold;">
-            🌟 Agentic AI 🌟
-          </div>
-          <div style="color:#33475b;margin-top:10px;font-size:14px;text-align:center;max-width:720px;">
-            Harness the power of <span style="color:#007acc;font-weight:bold;">Agentic AI</span> to predict tomorrow’s energy usage, optimize your settings, and automate daily reports effortlessly.
-          </div>
-        </div>
-        """,
-        unsafe_allow_html=True
-    )
+    # Header, page CSS and top spacer go out as one element instead of three
+    st.markdown(HEADER_HTML + PAGE_CSS + SPACER_HTML, unsafe_allow_html=True)
 
 # -------------------------------
 # Streamlit layout
@@ -235,160 +472,72 @@ def decorate_header():
 st.set_page_config(page_title="Home Energy Saver", page_icon="⚡", layout="wide")
 decorate_header()
 
-# Improved CSS
-st.markdown(
-    """
-    <style>
-    body {
-        background: linear-gradient(180deg, #eaf3ff 0%, #f4fff8 100%);
-        font-family: 'Segoe UI', Roboto, Arial, sans-serif;
-        color: #2a2e35;
-    }
-    .stApp {
-        padding: 16px;
-    }
-    h1 {
-        font-size: 1.6rem !important;
-        font-weight: 700;
-    }
-    .metric {
-        font-size: 0.9rem !important;
-    }
-    .subtitle {
-        color: #63748a;
-        font-size: 0.95rem;
-    }
-    .gauge-container {
-        max-width: 260px;
-        margin: 0 auto;
-    }
-    .stPlotlyChart {
-        padding: 6px !important;
-    }
-    /* Stylish green-gradient buttons for main actions */
-    .stButton > button {
-        background: linear-gradient(90deg, #16a34a 0%, #4ade80 100%);
-        color: #ffffff;
-        border: none;
-        padding: 10px 18px;
-        border-radius: 12px;
-        font-weight: 600;
-        font-size: 0.98rem;
-        box-shadow: 0 8px 20px rgba(16,185,129,0.14);
-        transition: transform 0.12s ease, box-shadow 0.12s ease, opacity 0.12s ease;
-        cursor: pointer;
-        width: 100%;
-    }
-    .stButton > button:hover:not(:disabled) {
-        transform: translateY(-3px);
-        box-shadow: 0 14px 34px rgba(16,185,129,0.18);
-        opacity: 0.98;
-    }
-    .stButton > button:active:not(:disabled) {
-        transform: translateY(0);
-        box-shadow: 0 6px 14px rgba(16,185,129,0.12);
-    }
-    .stButton > button[disabled], .stButton > button[aria-disabled="true"] {
-        background: linear-gradient(90deg,#eef6ef 0%, #f7fbf7 100%);
-        color: #9aa7a0;
-        border: 1px solid #e6f3ea;
-        box-shadow: none;
-        cursor: default;
-    }
-    /* Inline spinner for button-level feedback */
-    .inline-spinner {
-        border: 3px solid rgba(0,0,0,0.06);
-        border-top: 3px solid #16a34a;
-        border-radius: 50%;
-        width: 16px;
-        height: 16px;
-        display: inline-block;
-        vertical-align: middle;
-        animation: spin 1s linear infinite;
-        margin-right: 6px;
-    }
-    @keyframes spin { 0% { transform: rotate(0deg); } 100% { transform: rotate(360deg); } }
-    @media (max-width: 600px) {
-        h1 { font-size: 1.2rem !important; }
-        .gauge-container { max-width: 220px; }
-    }
-    </style>
-    """,
-    unsafe_allow_html=True,
-)
-
-# Top-level header
-st.markdown(
-    """
-    <div style="text-align: center; padding: 16px 0;">  
-        <div class="subtitle" style="font-size: 1.1rem; color: #33475b; margin-top: 8px;">
-        </div>
-    </div>
-    """,
-    unsafe_allow_html=True,
-)
-
 if "plan" not in st.session_state:
     st.session_state.plan = None
 
 # Sidebar
 with st.sidebar:
     st.subheader("⚙️ Input Parameters")
-    hh_size = st.number_input("Household size", min_value=1, max_value=20, value=4, step=1)
-    # Appliance selection is intentionally omitted: the model computes recommendations
-    # for the default five appliance categories. Display an informational note so users
-    # know which categories will be used.
-    st.markdown("**Appliances:** Using default categories (no selection required)")
-    st.caption("Default categories: " + ", ".join(DEFAULT_APPLIANCES))
-    # Use the fixed default appliance list when building requests
-    appliances = list(DEFAULT_APPLIANCES)
-    st.markdown("---")
-    st.caption("📍 Location")
-    # Simplified UI: user provides only a city name. We resolve coords silently
-    # and pick the closest match on Generate (no coordinate selection shown).
-    city_query = st.text_input("City", value="Pune, India", key="city_query")
-
-    # Default coordinates (used if geocoding fails)
-    latitude = 18.6298
-    longitude = 73.7997
-    timezone = st.selectbox("Timezone", TIMEZONES, index=TIMEZONES.index("Asia/Kolkata"))
-    st.markdown("---")
-    st.caption("💵 Tariff")
-    rate_peak = st.slider("Peak rate (INR/kWh)", min_value=0.0, max_value=20.0, value=12.0, step=0.1)
-    rate_offpeak = st.slider("Off-peak rate (INR/kWh)", min_value=0.0, max_value=20.0, value=7.5, step=0.1)
-
-    # Ensure tariff_peak_start and tariff_peak_end persist across reruns
-    if "tariff_peak_start" not in st.session_state:
-        st.session_state.tariff_peak_start = datetime.now().replace(hour=18, minute=0, second=0).time()
-    if "tariff_peak_end" not in st.session_state:
-        st.session_state.tariff_peak_end = datetime.now().replace(hour=22, minute=0, second=0).time()
-
-    tariff_peak_start = st.time_input(
-        "Peak start",
-        value=st.session_state.tariff_peak_start,
-        key="tariff_peak_start_input",
-    )
-    st.session_state.tariff_peak_start = tariff_peak_start
+    # Plan inputs live in one form: editing them does not rerun the script, and
+    # the values are committed together by the form's Generate button.
+    with st.form("cfg", border=False):
+        hh_size = st.number_input("Household size", min_value=1, max_value=20, value=4, step=1)
+        # Appliance selection is intentionally omitted: the model computes recommendations
+        # for the default five appliance categories. Display an informational note so users
+        # know which categories will be used.
+        st.markdown("**Appliances:** Using default categories (no selection required)")
+        st.caption("Default categories: " + ", ".join(DEFAULT_APPLIANCES))
+        # Use the fixed default appliance list when building requests
+        appliances = list(DEFAULT_APPLIANCES)
+        st.markdown("---")
+        st.caption("📍 Location")
+        # Simplified UI: user provides only a city name. We resolve coords silently
+        # and pick the closest match on Generate (no coordinate selection shown).
+        city_query = st.text_input("City", value="Pune, India", key="city_query")
+        timezone = st.selectbox("Timezone", TIMEZONES, index=TIMEZONES.index("Asia/Kolkata"))
+
+        # Default coordinates (used if geocoding fails)
+        latitude = 18.6298
+        longitude = 73.7997
+        st.markdown("---")
+        st.caption("💵 Tariff")
+        rate_peak = st.slider("Peak rate (INR/kWh)", min_value=0.0, max_value=20.0, value=12.0, step=0.1)
+        rate_offpeak = st.slider("Off-peak rate (INR/kWh)", min_value=0.0, max_value=20.0, value=7.5, step=0.1)
+
+        # Ensure tariff_peak_start and tariff_peak_end persist across reruns
+        st.session_state.setdefault("tariff_peak_start", time(18, 0))
+        st.session_state.setdefault("tariff_peak_end", time(22, 0))
+
+        tariff_peak_start = st.time_input(
+            "Peak start",
+            value=st.session_state.tariff_peak_start,
+            key="tariff_peak_start_input",
+        )
+        st.session_state.tariff_peak_start = tariff_peak_start
 
-    tariff_peak_end = st.time_input(
-        "Peak end",
-        value=st.session_state.tariff_peak_end,
-        key="tariff_peak_end_input",
-    )
-    st.session_state.tariff_peak_end = tariff_peak_end
+        tariff_peak_end = st.time_input(
+            "Peak end",
+            value=st.session_state.tariff_peak_end,
+            key="tariff_peak_end_input",
+        )
+        st.session_state.tariff_peak_end = tariff_peak_end
+
+        run_btn = st.form_submit_button(
+            "Generate Optimization Plan", use_container_width=True, type="primary"
+        )
 
+    # Read on every click, so these stay outside the form
+    force_refresh = st.checkbox("Force refresh (ignore cached plan)", value=False)
     st.markdown("---")
     email_to = st.text_input("Email to send plan (optional)")
     sender_name = st.text_input("Recipient name for email salutation", value="User")
     auto_hint = st.checkbox("Show daily automation hint", value=True)
 
 # Main actions
-# Button state: we will use a session flag to control sending so we can show
-# an inline status next to the button while the network call is in progress.
+# Button state: we use a session flag to control sending so we can show an
+# inline status next to the button while the (short) queueing call runs.
 if "send_email_requested" not in st.session_state:
     st.session_state.send_email_requested = False
-if "email_sending" not in st.session_state:
-    st.session_state.email_sending = False
 
 def _request_send_email():
     st.session_state.send_email_requested = True
@@ -396,9 +545,8 @@ def _request_send_email():
 
 controls_row = st.container()
 with controls_row:
-    c_run, c_email = st.columns([0.5, 0.5])
-    with c_run:
-        run_btn = st.button("Generate Optimization Plan", use_container_width=True, type="primary", key="generate_plan_btn")
+    # Generate is the sidebar form's submit button; only the email action lives here
+    _, c_email = st.columns([0.5, 0.5])
     with c_email:
         btn_col, status_col = st.columns([0.78, 0.22])
         with btn_col:
@@ -412,46 +560,65 @@ with controls_row:
 
 # Generate plan
 if run_btn:
-    # Resolve city -> lat/lon automatically (pick the first/closest match)
-    selected_city_display = None
-    try:
-        if city_query and city_query.strip():
-            geores = geocode_city(city_query.strip(), max_results=3)
-            if geores:
-                sel = geores[0]
-                try:
-                    latitude = float(sel.get("lat", latitude))
-                    longitude = float(sel.get("lon", longitude))
-                    selected_city_display = sel.get("display_name")
-                except Exception:
-                    # keep defaults if conversion fails
-                    pass
-    except Exception:
-        # If geocoding fails for any reason, fall back to defaults
-        latitude = latitude
-        longitude = longitude
-
-    req = {
-        "hh_size": int(hh_size),
-        "appliances_present": appliances,
-        "latitude": float(latitude),
-        "longitude": float(longitude),
-        "timezone": timezone,
-        "rate_peak": float(rate_peak),
-        "rate_offpeak": float(rate_offpeak),
-        "tariff_peak_start": tariff_peak_start.strftime("%H:%M"),
-        "tariff_peak_end": tariff_peak_end.strftime("%H:%M"),
-    }
+    # Fingerprint the raw inputs: when nothing changed since the last Generate,
+    # reuse the built request and skip geocoding and time formatting entirely.
+    fingerprint = (
+        int(hh_size), tuple(appliances), city_query, timezone,
+        float(rate_peak), float(rate_offpeak), tariff_peak_start, tariff_peak_end,
+    )
+    if st.session_state.get("_req_fingerprint") == fingerprint:
+        req, selected_city_display = st.session_state["_req"]
+    else:
+        # Resolve city -> lat/lon automatically (pick the first/closest match)
+        selected_city_display = None
+        try:
+            if city_query and city_query.strip():
+                geores = geocode_city(city_query, timezone)
+                if geores:
+                    sel = geores[0]
+                    try:
+                        latitude = float(sel.get("lat", latitude))
+                        longitude = float(sel.get("lon", longitude))
+                        selected_city_display = sel.get("display_name")
+                    except Exception:
+                        # keep defaults if conversion fails
+                        pass
+        except Exception:
+            # If geocoding fails for any reason, fall back to defaults
+            latitude = latitude
+            longitude = longitude
+
+        req = {
+            "hh_size": int(hh_size),
+            "appliances_present": appliances,
+            "latitude": float(latitude),
+            "longitude": float(longitude),
+            "timezone": timezone,
+            "rate_peak": float(rate_peak),
+            "rate_offpeak": float(rate_offpeak),
+            "tariff_peak_start": tariff_peak_start.strftime("%H:%M"),
+            "tariff_peak_end": tariff_peak_end.strftime("%H:%M"),
+        }
+        # Only memoize when the location resolved (or none was given), so a
+        # transient geocoding failure is retried on the next click
+        if selected_city_display or not (city_query and city_query.strip()):
+            st.session_state["_req_fingerprint"] = fingerprint
+            st.session_state["_req"] = (req, selected_city_display)
+
     if selected_city_display:
         # show friendly location confirmation (no coordinates shown)
         st.caption(f"Using location: {selected_city_display}")
     try:
-        with st.spinner("Calling optimizer…"):
-            plan = post_optimize_energy(req)
+        day = date.today().isoformat()
+        prune_stale_plans(day)
+        if force_refresh:
+            # drop only this request's entry, not every session's cached plans
+            get_plan.clear(req, PLAN_CACHE_VERSION, day)
+        plan = get_plan(req, PLAN_CACHE_VERSION, day, _refresh=force_refresh)
         st.session_state.plan = plan
         st.success("Optimization complete.")
-    except requests.HTTPError as e:
-        st.error(f"API error: {e.response.text if e.response is not None else e}")
+    except httpx.HTTPStatusError as e:
+        st.error(f"API error: {e.response.text}")
     except Exception as e:
         st.error(f"Unexpected error: {e}")
 
@@ -466,14 +633,9 @@ if st.session_state.plan:
     _, _, currency, total_kwh, total_cost = kpi_from_plan(st.session_state.plan)
 
     # Gauges
-    if PLOTLY_OK:
+    if plotly_ok():
         st.markdown("##### 📟 Savings Overview")
-        col1, col2 = st.columns(2)
-        with col1:
-            st.plotly_chart(render_gauge_kwh(total_kwh, "kWh Saved", unit="kWh"), use_container_width=True)
-        with col2:
-            # Use currency symbol as unit for the cost gauge
-            st.plotly_chart(render_gauge_kwh(total_cost, "₹ Saved", unit="₹"), use_container_width=True)
+        st.plotly_chart(render_dual_gauge(total_kwh, total_cost), use_container_width=True)
 
     # Recommendations
     st.markdown("#### Recommendations")
@@ -482,58 +644,29 @@ if st.session_state.plan:
     # Forecast details
     show_forecasts(st.session_state.plan)
 
-# Send email flow triggered via on_click -> session flag
-if st.session_state.get("send_email_requested"):
-    # Use the small status placeholder beside the button to show progress
-    try:
-        if not email_to:
-            email_status_placeholder.warning("Please provide an email address.")
-            st.session_state.send_email_requested = False
-        elif not st.session_state.plan:
-            email_status_placeholder.warning("Generate the plan first.")
-            st.session_state.send_email_requested = False
-        else:
-            st.session_state.email_sending = True
-            # Render a compact inline spinner next to the button
-            email_status_placeholder.markdown('<div class="inline-spinner"></div> Sending...', unsafe_allow_html=True)
-            try:
-                with st.spinner("Sending email..."):
-                    res = post_email_plan(st.session_state.plan, email_to, sender_name)
-                email_status_placeholder.success("Sent")
-                st.success(f"Email sent to {email_to}")
-                st.json(res)
-            except requests.HTTPError as e:
-                email_status_placeholder.error("Send failed")
-                st.error(f"Email API error: {e.response.text if e.response is not None else e}")
-            except Exception as e:
-                email_status_placeholder.error("Send failed")
-                st.error(f"Unexpected error: {e}")
-            finally:
-                st.session_state.email_sending = False
-                st.session_state.send_email_requested = False
-    except NameError:
-        # If placeholder isn't available for any reason, fallback to original flow
-        if not email_to:
-            st.warning("Please provide an email address.")
-        elif not st.session_state.plan:
-            st.warning("Generate the plan first.")
-        else:
-            try:
-                with st.spinner("Sending email..."):
-                    res = post_email_plan(st.session_state.plan, email_to, sender_name)
-                st.success(f"Email sent to {email_to}")
-                st.json(res)
-            except requests.HTTPError as e:
-                st.error(f"Email API error: {e.response.text if e.response is not None else e}")
-            except Exception as e:
-                st.error(f"Unexpected error: {e}")
+# Send email flow triggered via on_click -> session flag. /email-plan only
+# queues the send on the backend, so a direct call returns quickly.
+if st.session_state.send_email_requested:
+    st.session_state.send_email_requested = False
+    if not email_to:
+        email_status_placeholder.warning("Please provide an email address.")
+    elif not st.session_state.plan:
+        email_status_placeholder.warning("Generate the plan first.")
+    else:
+        # Render a compact inline spinner next to the button
+        email_status_placeholder.markdown('<div class="inline-spinner"></div> Sending...', unsafe_allow_html=True)
+        try:
+            with st.spinner("Sending email..."):
+                res = post_email_plan(st.session_state.plan, email_to, sender_name)
+            email_status_placeholder.success("Queued")
+            st.success(f"Email queued for {email_to}")
+            st.json(res)
+        except httpx.HTTPStatusError as e:
+            email_status_placeholder.error("Send failed")
+            st.error(f"Email API error: {e.response.text}")
+        except Exception as e:
+            email_status_placeholder.error("Send failed")
+            st.error(f"Unexpected error: {e}")
 
 # Footer
-st.markdown(
-    """
-    <div style="text-align:center;color:#94a3b8;margin-top:30px;font-size:0.85rem;">
-      Built with ❤️ using FastAPI · Microsoft Agent Framework · Streamlit
-    </div>
-    """,
-    unsafe_allow_html=True
-)
+st.markdown(FOOTER_HTML, unsafe_allow_html=True)